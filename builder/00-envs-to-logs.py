@@ -5,6 +5,8 @@ import os
 import sys
 import yaml
 import logging
+from collections import Counter
+from operator import attrgetter
 from pathlib import Path
 from typing import Dict, List, Optional
 from dataclasses import dataclass
@@ -18,7 +20,15 @@ handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
-@dataclass
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# slots=True is only understood by Python 3.10+
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_SLOTS)
 class EnvVariable:
     """Representation of environment variable with its value."""
     name: str
@@ -31,12 +41,11 @@ class EnvironmentConfig:
 
     def _load_config(self) -> Dict:
         try:
-            with open(self.config_path, encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-                self._validate_config(config)
-                return config
+            config = yaml.load(self.config_path.read_bytes(), Loader=SafeLoader)
+            self._validate_config(config)
+            return config
         except Exception as e:
-            logger.error("Failed to load config: {}".format(e))
+            logger.error("Failed to load config: %s", e)
             sys.exit(1)
 
     def _validate_config(self, config: Dict) -> None:
@@ -45,26 +54,25 @@ class EnvironmentConfig:
             sys.exit(1)
 
     def get_variables(self) -> List[EnvVariable]:
-        variables = []
-        seen = set()
-
-        for var_name in self.config['variables']:
-            if var_name in seen:
-                logger.warning("Duplicate variable found: {}".format(var_name))
-                continue
+        requested = self.config['variables']
+        names = list(dict.fromkeys(requested))
 
-            seen.add(var_name)
-            variables.append(EnvVariable(
-                name=var_name,
-                value=os.environ.get(var_name)
-            ))
+        if len(names) != len(requested):
+            for var_name, count in Counter(requested).items():
+                if count > 1:
+                    logger.warning("Duplicate variable found: %s", var_name)
 
-        return variables
+        env = os.environ
+        return [EnvVariable(name=var_name, value=env.get(var_name)) for var_name in names]
 
 def print_variables(variables: List[EnvVariable]) -> None:
-    for var in sorted(variables, key=lambda x: x.name):
-        value = '<NOT SET>' if var.value is None else var.value
-        logger.info("{} = {}".format(var.name, value))
+    if not variables:
+        return
+    ordered = sorted(variables, key=attrgetter('name'))
+    logger.info('\n'.join(
+        "{} = {}".format(var.name, '<NOT SET>' if var.value is None else var.value)
+        for var in ordered
+    ))
 
 def main() -> int:
     parser = argparse.ArgumentParser(description='Check environment variables from config')
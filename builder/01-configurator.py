@@ -3,14 +3,14 @@
 import argparse
 import os
 import sys
+import time
 import yaml
 import json
 import logging
-import re
+import string
 from pathlib import Path
-from typing import Dict, List, Set, Any, Optional
+from typing import Dict, FrozenSet, List, Set, Any, Optional, Tuple
 from dataclasses import dataclass
-from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 logger.propagate = False
@@ -20,13 +20,41 @@ handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
-@dataclass
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Deletes every allowed character, so whatever survives translate() is invalid
+_BRANCH_STRIP = str.maketrans('', '', string.ascii_letters + string.digits + '-_./')
+_FORBIDDEN_BRANCH_CHARS = frozenset('\\*?[]^~: \t()#@')
+_WATCHED_ENV_VARS = frozenset(('GITLAB_PLATFORMS', 'GITLAB_TAGS', 'DOWNLOAD_INTERNAL_EXTENSIONS'))
+_PLACEHOLDER_BRANCHES = frozenset(('default', 'null'))
+_STREAM_TASKS_THRESHOLD = 5000
+
+def _is_placeholder_branch(branch: str) -> bool:
+    """Check an already stripped env value for 'no override' markers."""
+    return not branch or branch.lower() in _PLACEHOLDER_BRANCHES
+
+# slots=True is only understood by Python 3.10+
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_SLOTS)
 class DownloadTask:
     extension_name: str
     project_id: int
     job_name: str
     branch: Optional[str] = None
 
+    def __post_init__(self):
+        if self.branch is not None:
+            self.branch = self.branch.strip() or None
+
     def to_dict(self) -> Dict[str, Any]:
         data = {
             'extension_name': self.extension_name,
@@ -34,32 +62,33 @@ class DownloadTask:
             'job_name': self.job_name
         }
         if self.branch:
-            data['branch'] = self.branch.strip()
+            data['branch'] = self.branch
         return data
 
     def format_info(self) -> str:
-        branch = self.branch.strip() if self.branch else 'default'
         return "{:<30} job: {:<15} branch: {:<20}".format(
             self.extension_name,
             self.job_name,
-            branch
+            self.branch or 'default'
         )
 
 class ExtensionConfig:
     def __init__(self, config_path: str):
         self.config_path = Path(config_path)
-        logger.debug("Loading configuration from: {}".format(self.config_path))
+        logger.debug("Loading configuration from: %s (YAML loader: %s)", self.config_path, SafeLoader.__name__)
+        self._env = os.environ.copy()
         self.config = self._load_config()
         self.global_branch = self._get_global_branch()
+        self._branch_cache: Dict[str, Optional[str]] = {}
 
     def _load_config(self) -> Dict:
         try:
-            with open(self.config_path, encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-                self._validate_config(config)
-                return config
+            config = yaml.load(self.config_path.read_bytes(), Loader=SafeLoader)
+            self._validate_config(config)
+            self._index_config(config)
+            return config
         except Exception as e:
-            logger.error("Failed to load config: {}".format(e))
+            logger.error("Failed to load config: %s", e)
             sys.exit(1)
 
     def _validate_config(self, config: Dict) -> None:
@@ -70,155 +99,172 @@ class ExtensionConfig:
         required = {'extensions', 'version'}
         missing = required - set(config.keys())
         if missing:
-            logger.error("Missing required fields: {}".format(', '.join(missing)))
+            logger.error("Missing required fields: %s", ', '.join(missing))
             sys.exit(1)
 
+    def _index_config(self, config: Dict) -> None:
+        self._by_product: Dict[str, List[Tuple[str, Dict]]] = {}
         for ext_name, ext_data in config.get('extensions', {}).items():
             if 'id' not in ext_data:
-                logger.error(f"Missing 'id' for extension {ext_name}")
+                logger.error("Missing 'id' for extension %s", ext_name)
                 sys.exit(1)
             if 'build_configs' not in ext_data:
-                logger.error(f"Missing 'build_configs' for extension {ext_name}")
+                logger.error("Missing 'build_configs' for extension %s", ext_name)
                 sys.exit(1)
+            ext_name = sys.intern(ext_name)
+            ext_data['name'] = ext_name
+            ext_data['_env_key'] = "EXTENSIONS_{}_BRANCH".format(ext_name.upper())
             for build in ext_data['build_configs']:
                 if 'job_name' not in build:
-                    logger.error(f"Missing 'job_name' in build_configs for {ext_name}")
+                    logger.error("Missing 'job_name' in build_configs for %s", ext_name)
                     sys.exit(1)
+                if isinstance(build['job_name'], str):
+                    build['job_name'] = sys.intern(build['job_name'])
+                build['_platforms'] = frozenset(build.get('platforms', ()))
+            for product in dict.fromkeys(ext_data.get('products', ())):
+                self._by_product.setdefault(product, []).append((ext_name, ext_data))
 
     def _get_global_branch(self) -> Optional[str]:
-        global_branch = os.getenv('EXTENSIONS_GLOBAL_BRANCH')
+        global_branch = self._env.get('EXTENSIONS_GLOBAL_BRANCH')
 
         if global_branch:
             global_branch = global_branch.strip()
-            logger.info("Using global branch from environment: {}".format(global_branch))
-            if global_branch.lower() not in ('default', 'null', ''):
-                self.validate_branch(global_branch, 'global')
-                return global_branch
+            logger.info("Using global branch from environment: %s", global_branch)
+            if not _is_placeholder_branch(global_branch):
+                return self.validate_branch(global_branch, 'global')
 
         config_branch = self.config.get('global_branch')
-        if config_branch:
-            config_branch = config_branch.strip()
-            if config_branch:
-                self.validate_branch(config_branch, 'global')
-                logger.info("Using global branch from config: {}".format(config_branch))
-                return config_branch
+        if config_branch and not config_branch.isspace():
+            config_branch = self.validate_branch(config_branch, 'global')
+            logger.info("Using global branch from config: %s", config_branch)
+            return config_branch
 
         logger.info("No global branch configured")
         return None
 
-    def validate_branch(self, branch: str, ext_name: str) -> None:
+    def validate_branch(self, branch: str, ext_name: str) -> str:
+        """Validate branch name and return it stripped; exits on invalid input."""
         if not branch or not isinstance(branch, str):
-            logger.error("Invalid branch name for {}".format(ext_name))
+            logger.error("Invalid branch name for %s", ext_name)
             sys.exit(1)
 
         branch = branch.strip()
 
         if len(branch) > 255:
-            logger.error("Branch name too long for {}".format(ext_name))
+            logger.error("Branch name too long for %s", ext_name)
             sys.exit(1)
 
-        if branch.startswith('-') or branch.endswith('.lock'):
-            logger.error("Invalid branch name format for {}".format(ext_name))
+        if not branch or branch[0] == '-' or branch.endswith('.lock'):
+            logger.error("Invalid branch name format for %s", ext_name)
             sys.exit(1)
 
-        forbidden = {'\\', '*', '?', '[', ']', '^', '~', ':', ' ', '\t', '(', ')', '#', '@'}
-        if any(c in branch for c in forbidden):
-            logger.error("Branch contains forbidden chars: {}".format(ext_name))
+        invalid = branch.translate(_BRANCH_STRIP)
+        if invalid:
+            if not _FORBIDDEN_BRANCH_CHARS.isdisjoint(invalid):
+                logger.error("Branch contains forbidden chars: %s", ext_name)
+            else:
+                logger.error("Invalid branch format: %s", ext_name)
             sys.exit(1)
 
-        if not re.match(r'^[a-zA-Z0-9\-_./]+$', branch):
-            logger.error("Invalid branch format: {}".format(ext_name))
-            sys.exit(1)
+        return branch
 
     def get_branch(self, ext_data: Dict[str, Any]) -> Optional[str]:
-        global_env_branch = os.getenv('EXTENSIONS_GLOBAL_BRANCH')
-        if global_env_branch:
-            global_env_branch = global_env_branch.strip()
-            if global_env_branch.lower() not in ('default', 'null', ''):
-                self.validate_branch(global_env_branch, 'global')
-                logger.info("Using global branch from environment: {}".format(global_env_branch))
-                return global_env_branch
+        ext_name = ext_data['name']
+        if ext_name not in self._branch_cache:
+            self._branch_cache[ext_name] = self._resolve_branch(ext_data)
+        return self._branch_cache[ext_name]
 
+    def _resolve_branch(self, ext_data: Dict[str, Any]) -> Optional[str]:
         if self.global_branch:
-            logger.info("Using global branch from config: {}".format(self.global_branch))
+            logger.info("Using global branch: %s", self.global_branch)
             return self.global_branch
 
         ext_name = ext_data['name']
-        env_name = "EXTENSIONS_{}_BRANCH".format(ext_name.upper())
-        ext_env_branch = os.getenv(env_name)
+        ext_env_branch = self._env.get(ext_data['_env_key'])
         if ext_env_branch:
             ext_env_branch = ext_env_branch.strip()
-            if ext_env_branch.lower() not in ('default', 'null', ''):
-                self.validate_branch(ext_env_branch, ext_name)
-                logger.info("Using branch from environment for {}: {}".format(ext_name, ext_env_branch))
+            if not _is_placeholder_branch(ext_env_branch):
+                ext_env_branch = self.validate_branch(ext_env_branch, ext_name)
+                logger.info("Using branch from environment for %s: %s", ext_name, ext_env_branch)
                 return ext_env_branch
 
         branch = ext_data.get('branch')
-        if branch:
-            branch = branch.strip()
-            if branch:
-                self.validate_branch(branch, ext_name)
-                logger.info("Using branch from extension config for {}: {}".format(ext_name, branch))
-                return branch
+        if branch and not branch.isspace():
+            branch = self.validate_branch(branch, ext_name)
+            logger.info("Using branch from extension config for %s: %s", ext_name, branch)
+            return branch
 
-        logger.debug("No branch found for {}".format(ext_name))
+        logger.debug("No branch found for %s", ext_name)
         return None
 
     def filter_extensions(self, platforms: Set[str], product: str, include_extensions: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
         try:
             result = []
+            if not product and not include_extensions:
+                return result
+            if not self.config.get('extensions'):
+                logger.info("No extensions defined in config")
+                return result
+
+            platforms = frozenset(platforms)
             include_extensions = include_extensions or set()
 
-            logger.info("\n=== Search criteria ===")
-            logger.info(f"| Required platforms: {', '.join(sorted(platforms))}")
-            if product:
-                logger.info(f"| Product: {product}")
-            if include_extensions:
-                logger.info(f"| Additional extensions: {', '.join(sorted(include_extensions))}")
-            logger.info("=" * 50)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("\n=== Search criteria ===")
+                logger.info("| Required platforms: %s", ', '.join(sorted(platforms)))
+                if product:
+                    logger.info("| Product: %s", product)
+                if include_extensions:
+                    logger.info("| Additional extensions: %s", ', '.join(sorted(include_extensions)))
+                logger.info("=" * 50)
 
-            processed_extensions = set()
+            checked_extensions = set()
             if product:
-                for ext_name, ext_data in self.config.get('extensions', {}).items():
-                    ext_data['name'] = ext_name
-                    ext_products = set(ext_data.get('products', []))
-                    if product in ext_products:
-                        if self._check_and_add_extension(ext_name, ext_data, platforms, result):
-                            processed_extensions.add(ext_name)
+                for ext_name, ext_data in self._by_product.get(product, ()):
+                    checked_extensions.add(ext_name)
+                    self._check_and_add_extension(ext_name, ext_data, platforms, result)
 
-            if include_extensions:
+            if include_extensions - checked_extensions:
                 for ext_name, ext_data in self.config.get('extensions', {}).items():
-                    if ext_name in include_extensions and ext_name not in processed_extensions:
-                        ext_data['name'] = ext_name
+                    if ext_name in include_extensions and ext_name not in checked_extensions:
                         self._check_and_add_extension(ext_name, ext_data, platforms, result)
 
             return result
         except Exception as e:
-            logger.error(f"Error during extension filtering: {e}")
+            logger.error("Error during extension filtering: %s", e)
             sys.exit(1)
 
-    def _check_and_add_extension(self, ext_name: str, ext_data: Dict, platforms: Set[str], result: List) -> bool:
+    def _check_and_add_extension(self, ext_name: str, ext_data: Dict, platforms: FrozenSet[str], result: List) -> bool:
         try:
-            logger.info(f"\nChecking extension: {ext_name}")
+            verbose = logger.isEnabledFor(logging.DEBUG)
+            details = []
+            if verbose:
+                details.append(f"\nChecking extension: {ext_name}")
             for build in ext_data.get('build_configs', []):
-                build_platforms = set(build.get('platforms', []))
-                job_name = build['job_name']
-                logger.info(f"| Job: {job_name}")
-                logger.info(f"|   Available platforms: {', '.join(sorted(build_platforms))}")
-                
-                matching_platforms = platforms & build_platforms
-                if matching_platforms:
-                    logger.info(f"|   [MATCH] Found matching platforms: {', '.join(sorted(matching_platforms))}")
+                build_platforms = build['_platforms']
+                matched = not platforms.isdisjoint(build_platforms)
+                if verbose:
+                    details.append(f"| Job: {build['job_name']}")
+                    details.append(f"|   Available platforms: {', '.join(sorted(build_platforms))}")
+                    if not matched:
+                        details.append("|   [SKIP] No matching platforms found")
+
+                if matched:
+                    if verbose:
+                        logger.debug('\n'.join(details))
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("[MATCH] %s: %s (%s)", ext_name, build['job_name'],
+                                    ', '.join(sorted(platforms & build_platforms)))
                     info = self._create_extension_info(ext_name, ext_data, build)
                     result.append(info)
                     return True
-                else:
-                    logger.info("|   [SKIP] No matching platforms found")
 
-            logger.info("| No matching build configuration found")
+            if verbose:
+                logger.debug('\n'.join(details))
+            logger.info("[SKIP] %s: no matching build configuration", ext_name)
             return False
         except Exception as e:
-            logger.error(f"Error checking extension {ext_name}: {e}")
+            logger.error("Error checking extension %s: %s", ext_name, e)
             sys.exit(1)
 
     def _create_extension_info(self, ext_name: str, ext_data: Dict, build: Dict) -> Dict:
@@ -232,68 +278,115 @@ class ExtensionConfig:
             info['branch'] = branch
         return info
 
-def generate_tasks(extensions: List[Dict[str, Any]]) -> List[DownloadTask]:
+def generate_tasks(extensions: List[Dict[str, Any]], as_dicts: bool = False) -> List[Any]:
+    """Build one task per extension; with as_dicts, emit to_dict()-shaped dicts directly."""
     try:
-        seen = set()
+        seen: Dict[Tuple[int, str], str] = {}
         tasks = []
         for ext in extensions:
             key = (ext['id'], ext['job_name'])
             if key in seen:
-                logger.error("Duplicate task: {}".format(ext['name']))
+                logger.error("Duplicate task: %s conflicts with %s", ext['name'], seen[key])
                 sys.exit(1)
-            seen.add(key)
-            tasks.append(DownloadTask(
-                extension_name=ext['name'],
-                project_id=ext['id'],
-                job_name=ext['job_name'],
-                branch=ext.get('branch')
-            ))
+            seen[key] = ext['name']
+            if as_dicts:
+                task = {
+                    'extension_name': ext['name'],
+                    'project_id': ext['id'],
+                    'job_name': ext['job_name']
+                }
+                if ext.get('branch'):
+                    task['branch'] = ext['branch']
+                tasks.append(task)
+            else:
+                tasks.append(DownloadTask(
+                    extension_name=ext['name'],
+                    project_id=ext['id'],
+                    job_name=ext['job_name'],
+                    branch=ext.get('branch')
+                ))
         return tasks
     except Exception as e:
-        logger.error(f"Error generating tasks: {e}")
+        logger.error("Error generating tasks: %s", e)
         sys.exit(1)
 
+def _parse_csv_set(value: str) -> Set[str]:
+    parts = (p.strip() for p in value.split(','))
+    return {p for p in parts if p}
+
 def parse_platforms(platforms_str: str) -> Set[str]:
     try:
         if not platforms_str:
             logger.error("Platforms cannot be empty")
             sys.exit(1)
-        return {p.strip() for p in platforms_str.split(',') if p.strip()}
+        return _parse_csv_set(platforms_str)
     except Exception as e:
-        logger.error(f"Error parsing platforms: {e}")
+        logger.error("Error parsing platforms: %s", e)
         sys.exit(1)
 
 def parse_extensions(extensions_str: Optional[str]) -> Set[str]:
     try:
         if extensions_str is None or not extensions_str.strip():
             return set()
-        return {e.strip() for e in extensions_str.split(',') if e.strip()}
+        return _parse_csv_set(extensions_str)
     except Exception as e:
-        logger.error(f"Error parsing extensions: {e}")
+        logger.error("Error parsing extensions: %s", e)
         sys.exit(1)
 
-def write_tasks(path: str, tasks: List[DownloadTask]) -> None:
+def _utc_timestamp() -> str:
+    """Current UTC time in the same format as datetime.isoformat() with microseconds."""
+    now = time.time()
+    return "{}.{:06d}+00:00".format(time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)),
+                                    int(now % 1 * 1_000_000))
+
+def _dump_json(data: Dict[str, Any], pretty: bool) -> bytes:
+    if orjson is not None:
+        option = orjson.OPT_APPEND_NEWLINE | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(data, option=option)
+    if pretty:
+        text = json.dumps(data, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    return (text + '\n').encode('utf-8')
+
+def _sync_file(f, durable: bool) -> None:
+    if durable:
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_tasks(path: str, tasks: List[Any], pretty: bool = False, durable: bool = False) -> None:
     try:
         data = {
             'version': '1.0',
-            'generated_at': datetime.now(timezone.utc).isoformat(),
-            'tasks': [t.to_dict() for t in tasks]
+            'generated_at': _utc_timestamp(),
+            'tasks': [t if isinstance(t, dict) else t.to_dict() for t in tasks]
         }
 
         path_obj = Path(path)
         tmp_path = path_obj.with_suffix('.tmp')
         try:
             path_obj.parent.mkdir(parents=True, exist_ok=True)
-            with open(tmp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            tmp_path.replace(path_obj)
-            logger.debug("Tasks written to: {}".format(path_obj))
+            if len(tasks) > _STREAM_TASKS_THRESHOLD:
+                # Encode incrementally so a huge task list never exists as one string
+                encoder = json.JSONEncoder(indent=2 if pretty else None,
+                                           separators=(',', ': ') if pretty else (',', ':'),
+                                           ensure_ascii=False)
+                with open(tmp_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                    f.writelines(encoder.iterencode(data))
+                    f.write('\n')
+                    _sync_file(f, durable)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    f.write(_dump_json(data, pretty))
+                    _sync_file(f, durable)
+            os.replace(tmp_path, path_obj)
+            logger.debug("Tasks written to: %s", path_obj)
         except Exception as e:
             if tmp_path.exists():
                 tmp_path.unlink()
             raise
     except Exception as e:
-        logger.error(f"Failed writing tasks: {e}")
+        logger.error("Failed writing tasks: %s", e)
         sys.exit(1)
 
 def main() -> int:
@@ -304,6 +397,8 @@ def main() -> int:
         parser.add_argument('--product', help='Single product to filter by (e.g., python)')
         parser.add_argument('--include-extensions', nargs='?', const='', default=None, help='Additional extensions to include')
         parser.add_argument('--output', required=True, help='Output JSON path')
+        parser.add_argument('--pretty', action='store_true', help='Indent the output JSON for readability')
+        parser.add_argument('--durable', action='store_true', help='fsync the output JSON before replacing it')
         parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose logging output')
         args = parser.parse_args()
 
@@ -311,26 +406,29 @@ def main() -> int:
             logger.setLevel(logging.DEBUG)
 
         logger.info("\nEnvironment variables:")
-        env_vars = [k for k in os.environ if k.upper().startswith('EXTENSIONS_') or k.upper() in ('GITLAB_PLATFORMS', 'DOWNLOAD_INTERNAL_EXTENSIONS')]
-        if env_vars:
-            for k in env_vars:
-                logger.info(f"| {k}={os.environ[k]}")
-        else:
+        env_found = False
+        download_flag = None
+        for k, v in os.environ.items():
+            ku = k.upper()
+            if ku.startswith('EXTENSIONS_') or ku in _WATCHED_ENV_VARS:
+                logger.info("| %s=%s", k, v)
+                env_found = True
+                if download_flag is None and ku == 'DOWNLOAD_INTERNAL_EXTENSIONS':
+                    download_flag = v
+        if not env_found:
             logger.info("| No relevant environment variables found")
 
         downloads_enabled = True
-        for k, v in os.environ.items():
-            if k.upper() == 'DOWNLOAD_INTERNAL_EXTENSIONS':
-                downloads_enabled = v.lower().strip() == 'true'
-                logger.info(f"\nDownload internal extensions: {downloads_enabled}")
-                break
+        if download_flag is not None:
+            downloads_enabled = download_flag.lower().strip() == 'true'
+            logger.info("\nDownload internal extensions: %s", downloads_enabled)
 
         if not downloads_enabled:
             logger.info("Downloads disabled by environment variable, generating empty config")
-            write_tasks(args.output, [])
+            write_tasks(args.output, [], args.pretty, args.durable)
             return 0
 
-        logger.info(f"\nLoading config: {args.config}")
+        logger.info("\nLoading config: %s", args.config)
 
         config = ExtensionConfig(args.config)
         platforms = parse_platforms(args.platforms)
@@ -343,22 +441,22 @@ def main() -> int:
 
         if not include_extensions and not product:
             logger.info("\nNo extensions or product specified, generating empty config")
-            write_tasks(args.output, [])
+            write_tasks(args.output, [], args.pretty, args.durable)
             return 0
 
         extensions = config.filter_extensions(platforms, product, include_extensions)
         if not extensions:
             logger.warning("\nNo matching extensions found")
-            write_tasks(args.output, [])
+            write_tasks(args.output, [], args.pretty, args.durable)
             return 0
 
-        tasks = generate_tasks(extensions)
-        write_tasks(args.output, tasks)
-        logger.info(f"\nTotal tasks generated: {len(tasks)}")
+        tasks = generate_tasks(extensions, as_dicts=True)
+        write_tasks(args.output, tasks, args.pretty, args.durable)
+        logger.info("\nTotal tasks generated: %s", len(tasks))
         return 0
 
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         return 1
 
 if __name__ == '__main__':
@@ -2,15 +2,23 @@
 
 import sys
 import json
+import re
+import random
+import socket
+import http.client
+import threading
 import urllib.request
 import urllib.error
 import logging
 import argparse
 import time
 import ssl
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from urllib.parse import urlencode, urljoin, urlsplit
+from typing import Optional, List, Dict, Any, Set
 from dataclasses import dataclass, field
 
 # Configure logging to write to stdout
@@ -21,11 +29,12 @@ handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+_SSL_CTX = ssl.create_default_context()
+_SSL_CTX.check_hostname = True
+
 def get_ssl_context():
-    """Create SSL context for API requests."""
-    ctx = ssl.create_default_context()
-    ctx.check_hostname = True
-    return ctx
+    """Return the shared SSL context for API requests."""
+    return _SSL_CTX
 
 class DownloadError(Exception): pass
 class ConfigurationError(Exception): pass
@@ -55,18 +64,150 @@ class Config:
     generated_at: datetime
     tasks: List[TaskConfig]
 
+class MetadataCache:
+    """SQLite cache of job lists for pipelines that have finished."""
+
+    TERMINAL_STATUSES = frozenset(('success', 'failed', 'canceled', 'skipped'))
+    MAX_ENTRIES = 5000
+
+    def __init__(self, path: Path, origin: str):
+        self.origin = origin
+        self._lock = threading.Lock()
+        # Hits are only noted here and written once in close(), so reads never hold a write lock
+        self._used: Set[tuple] = set()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pipeline_jobs ('
+            'origin TEXT, project_id INTEGER, pipeline_id INTEGER, updated_at TEXT, '
+            'jobs_json TEXT, used_at REAL, PRIMARY KEY (origin, project_id, pipeline_id))'
+        )
+
+    def get_jobs(self, project_id: int, pipeline: Dict[str, Any]) -> Optional[List[Any]]:
+        """Return cached jobs if the pipeline has not changed since it was stored."""
+        key = (self.origin, project_id, pipeline['id'])
+        with self._lock:
+            row = self._db.execute(
+                'SELECT updated_at, jobs_json FROM pipeline_jobs '
+                'WHERE origin = ? AND project_id = ? AND pipeline_id = ?', key
+            ).fetchone()
+            if row is None or row[0] != pipeline.get('updated_at'):
+                return None
+            self._used.add(key)
+        return json.loads(row[1])
+
+    def put_jobs(self, project_id: int, pipeline: Dict[str, Any], jobs: List[Any]) -> None:
+        """Store jobs of a finished pipeline; running pipelines are never cached."""
+        if pipeline.get('status') not in self.TERMINAL_STATUSES or not pipeline.get('updated_at'):
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO pipeline_jobs VALUES (?, ?, ?, ?, ?, ?)',
+                (self.origin, project_id, pipeline['id'], pipeline['updated_at'],
+                 json.dumps(jobs, separators=(',', ':')), time.time())
+            )
+            # Short transactions: concurrent runs can share the file and a crash keeps finished work
+            self._db.commit()
+
+    def close(self) -> None:
+        """Record cache hits, evict least recently used entries over the limit and close."""
+        with self._lock:
+            now = time.time()
+            self._db.executemany(
+                'UPDATE pipeline_jobs SET used_at = ? '
+                'WHERE origin = ? AND project_id = ? AND pipeline_id = ?',
+                [(now,) + key for key in self._used]
+            )
+            self._used.clear()
+            self._db.execute(
+                'DELETE FROM pipeline_jobs WHERE rowid NOT IN '
+                '(SELECT rowid FROM pipeline_jobs ORDER BY used_at DESC LIMIT ?)',
+                (self.MAX_ENTRIES,)
+            )
+            self._db.commit()
+            self._db.close()
+
 class GitLabClient:
     """Client for interacting with GitLab API."""
 
-    def __init__(self, base_url: str, token: str):
+    PIPELINE_WINDOW = 3
+
+    def __init__(self, base_url: str, token: str, cache: Optional[MetadataCache] = None):
         """Initialize GitLab client with base URL and authentication token."""
-        self.base_url = base_url.rstrip('/')
-        if not self.base_url.endswith('/api/v4'):
-            self.base_url = f"{self.base_url}/api/v4"
+        self.base_url = re.sub(r'(/api/v4)+$', '', base_url.rstrip('/')) + '/api/v4'
         self.headers = {
             'PRIVATE-TOKEN': token,
             'Accept': 'application/json'
         }
+        self._origin = urlsplit(self.base_url)
+        # Proxied origins go through urlopen, which handles proxy auth and CONNECT
+        self._use_proxy = (self._origin.scheme in urllib.request.getproxies()
+                           and not urllib.request.proxy_bypass(self._origin.hostname or ''))
+        self._local = threading.local()
+        self._conns: Set[http.client.HTTPConnection] = set()
+        self._conns_lock = threading.Lock()
+        self.cache = cache
+        self._project_web_urls: Dict[int, str] = {}
+        self._project_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gitlab-jobs')
+
+    def close(self) -> None:
+        """Wait for outstanding pipeline lookups to finish and close pooled sockets."""
+        self._executor.shutdown(wait=True)
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        """Return this thread's keep-alive connection to the GitLab host."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._origin.scheme == 'https':
+                conn = http.client.HTTPSConnection(self._origin.netloc, context=get_ssl_context())
+            else:
+                conn = http.client.HTTPConnection(self._origin.netloc)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.add(conn)
+        return conn
+
+    def _drop_connection(self, conn: http.client.HTTPConnection) -> None:
+        conn.close()
+        self._local.conn = None
+        with self._conns_lock:
+            self._conns.discard(conn)
+
+    def _open(self, url: str, extra_headers: Optional[Dict[str, str]] = None):
+        """GET url reusing a pooled connection; raises HTTPError like urlopen."""
+        parts = urlsplit(url)
+        path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+        headers = {**self.headers, **extra_headers} if extra_headers else self.headers
+        if self._use_proxy:
+            request = urllib.request.Request(url, headers=headers)
+            return urllib.request.urlopen(request, context=get_ssl_context())
+
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Server dropped the idle connection or it was left mid-response
+                self._drop_connection(conn)
+                if attempt:
+                    raise
+
+        if response.status in (301, 302, 303, 307, 308):
+            location = urljoin(url, response.getheader('Location', ''))
+            response.read()
+            request = urllib.request.Request(location, headers=headers)
+            return urllib.request.urlopen(request, context=get_ssl_context())
+        if response.status >= 400:
+            response.read()
+            raise urllib.error.HTTPError(url, response.status, response.reason,
+                                         response.headers, None)
+        return response
 
     def _get_paginated_results(self, endpoint: str, params: Optional[Dict] = None) -> List[Any]:
         """Get all results using pagination."""
@@ -95,18 +236,11 @@ class GitLabClient:
     def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Any:
         """Make authenticated request to GitLab API."""
         url = f"{self.base_url}/{endpoint}"
-        if '/api/v4/api/v4' in url:
-            url = url.replace('/api/v4/api/v4', '/api/v4')
-
         if params:
-            query_string = '&'.join(f"{k}={v}" for k, v in params.items())
-            url = f"{url}?{query_string}"
-
-        request = urllib.request.Request(url, headers=self.headers)
+            url = f"{url}?{urlencode(params, doseq=True)}"
 
         try:
-            ctx = get_ssl_context()
-            with urllib.request.urlopen(request, context=ctx) as response:
+            with self._open(url) as response:
                 return json.loads(response.read().decode('utf-8'))
         except urllib.error.HTTPError as e:
             if e.code in [401, 403, 404]:
@@ -130,10 +264,45 @@ class GitLabClient:
         """Get default branch name for a project."""
         try:
             project = self._make_request(f'projects/{project_id}')
+            if project.get('web_url'):
+                with self._project_lock:
+                    self._project_web_urls[project_id] = project['web_url']
             return project.get('default_branch', 'master')
         except Exception:
             return 'master'
 
+    def _job_web_url(self, project_id: int, job: Dict[str, Any]) -> str:
+        """Get job page URL from the job listing, falling back to the project URL."""
+        if job.get('web_url'):
+            return job['web_url']
+        # Held across the fetch so concurrent misses for a project make a single request
+        with self._project_lock:
+            web_url = self._project_web_urls.get(project_id)
+            if web_url is None:
+                web_url = self._make_request(f'projects/{project_id}')['web_url']
+                self._project_web_urls[project_id] = web_url
+        return f"{web_url}/-/jobs/{job['id']}"
+
+    def _get_pipeline_jobs(self, project_id: int, pipeline: Dict[str, Any]) -> List[Any]:
+        """Get all jobs of a pipeline, served from the metadata cache when possible."""
+        if self.cache:
+            try:
+                jobs = self.cache.get_jobs(project_id, pipeline)
+                if jobs is not None:
+                    return jobs
+            except sqlite3.Error as e:
+                logger.debug(f"Metadata cache read failed: {e}")
+
+        jobs = self._get_paginated_results(
+            f'projects/{project_id}/pipelines/{pipeline["id"]}/jobs'
+        )
+        if self.cache:
+            try:
+                self.cache.put_jobs(project_id, pipeline, jobs)
+            except sqlite3.Error as e:
+                logger.debug(f"Metadata cache write failed: {e}")
+        return jobs
+
     def get_job_info(self, project_id: int, job_id: Optional[int] = None,
                  job_name: Optional[str] = None, branch: Optional[str] = None) -> Dict[str, Any]:
         """Get information about latest successful job from a pipeline."""
@@ -159,57 +328,113 @@ class GitLabClient:
         if not pipelines:
             raise DownloadError(f"No pipelines found in branch '{branch}'")
 
-        for pipeline in pipelines:
-            jobs = self._get_paginated_results(
-                f'projects/{project_id}/pipelines/{pipeline["id"]}/jobs'
-            )
-
-            matching_jobs = [j for j in jobs if j['name'] == job_name and j['status'] == 'success']
-
-            if matching_jobs:
-                job_info = self._make_request(f'projects/{project_id}/jobs/{matching_jobs[0]["id"]}')
-                return {
-                    'job_id': matching_jobs[0]['id'],
-                    'pipeline_id': pipeline['id'],
-                    'branch': branch or pipeline['ref'],
-                    'created_at': pipeline['created_at'],
-                    'web_url': job_info['web_url']
-                }
-
-        raise DownloadError(f"No successful jobs '{job_name}' found")
+        def successful(jobs: List[Any]) -> List[Any]:
+            return [j for j in jobs if j['name'] == job_name and j['status'] == 'success']
+
+        # The newest pipeline usually has the job, so it is checked on its own first
+        pipeline = pipelines[0]
+        matching_jobs = successful(self._get_pipeline_jobs(project_id, pipeline))
+        remaining = pipelines[1:]
+        while not matching_jobs and remaining:
+            # Older pipelines are prefetched a few at a time; a hit wastes at most the rest of a window
+            window, remaining = remaining[:self.PIPELINE_WINDOW], remaining[self.PIPELINE_WINDOW:]
+            futures = [self._executor.submit(self._get_pipeline_jobs, project_id, p) for p in window]
+            try:
+                for pipeline, future in zip(window, futures):
+                    matching_jobs = successful(future.result())
+                    if matching_jobs:
+                        break
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        if not matching_jobs:
+            raise DownloadError(f"No successful jobs '{job_name}' found")
+
+        return {
+            'job_id': matching_jobs[0]['id'],
+            'pipeline_id': pipeline['id'],
+            'branch': branch or pipeline['ref'],
+            'created_at': pipeline['created_at'],
+            'web_url': self._job_web_url(project_id, matching_jobs[0])
+        }
 
     def download_artifact(self, project_id: int, job_id: int, output_path: Path) -> None:
         """Download job artifacts to specified path."""
         url = f"{self.base_url}/projects/{project_id}/jobs/{job_id}/artifacts"
-        request = urllib.request.Request(url, headers=self.headers)
-        ctx = get_ssl_context()
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+        validator = None
 
-        for attempt in range(3):
+        for attempt in range(5):
             try:
-                with urllib.request.urlopen(request, context=ctx) as response:
-                    output_path.parent.mkdir(parents=True, exist_ok=True)
-                    with open(output_path, 'wb') as f:
+                # Resume an interrupted transfer instead of starting from byte 0;
+                # If-Range makes the server send the whole file if it has changed
+                headers = None
+                if written:
+                    headers = {'Range': f'bytes={written}-'}
+                    if validator:
+                        headers['If-Range'] = validator
+                with self._open(url, headers) as response:
+                    if response.status == 206:
+                        match = re.match(r'bytes (\d+)-', response.getheader('Content-Range', ''))
+                        if not match or int(match.group(1)) != written:
+                            written = 0
+                            raise http.client.HTTPException("Unexpected Content-Range, restarting download")
+                    else:
+                        written = 0
+                        etag = response.getheader('ETag')
+                        validator = etag if etag and not etag.startswith('W/') else response.getheader('Last-Modified')
+                    with open(output_path, 'ab' if written else 'wb') as f:
                         while True:
-                            chunk = response.read(8192)
+                            chunk = response.read(65536)
                             if not chunk:
                                 break
                             f.write(chunk)
+                            written += len(chunk)
+                    if response.length:
+                        raise http.client.IncompleteRead(b'', response.length)
                 return
             except urllib.error.HTTPError as e:
                 if e.code == 404:
                     raise DownloadError("Artifacts not found")
-                if attempt == 2:
+                if e.code in (401, 403) or attempt == 4:
                     raise
-                time.sleep(min(4 * (2 ** attempt), 10))
+                if e.code == 416:
+                    written = 0
+            except (urllib.error.URLError, ConnectionError, socket.timeout, http.client.HTTPException):
+                # Only network failures are retried; local file errors propagate
+                if attempt == 4:
+                    raise
+            time.sleep(min(4 * (2 ** attempt), 10) + random.uniform(0, 1))
 
 class ArtifactDownloader:
     """High-level interface for downloading GitLab artifacts."""
 
-    def __init__(self, gitlab_url: str, token: str, output_dir: Path):
+    def __init__(self, gitlab_url: str, token: str, output_dir: Path, max_workers: int = 8,
+                 use_cache: bool = True):
         """Initialize downloader with GitLab URL, token and output directory."""
-        self.client = GitLabClient(gitlab_url, token)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max(1, max_workers)
+
+        self.client = GitLabClient(gitlab_url, token)
+        if use_cache:
+            # Keyed on the normalised API URL so '/api/v4' in --url shares entries
+            try:
+                self.client.cache = MetadataCache(self.output_dir / '.gitlab_cache.db', self.client.base_url)
+            except sqlite3.Error as e:
+                logger.warning(f"Metadata cache disabled: {e}")
+
+    def close(self) -> None:
+        """Stop background lookups and flush the metadata cache."""
+        self.client.close()
+        if self.client.cache:
+            try:
+                self.client.cache.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to save metadata cache: {e}")
+            self.client.cache = None
 
     def format_output_path(self, name: str, job_info: Dict[str, Any]) -> Path:
         """Generate output path for artifact file."""
@@ -308,7 +533,12 @@ class ArtifactDownloader:
                 raise ConfigurationError(f"Failed to load config: {str(e)}")
 
         self.client.check_connection()
-        return [self.process_task(task) for task in tasks]
+        if len(tasks) == 1 or self.max_workers == 1:
+            return [self.process_task(task) for task in tasks]
+
+        # Tasks are network-bound; overlap them and keep results in task order
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+            return list(executor.map(self.process_task, tasks))
 
 def main() -> int:
     """Main function that returns exit code."""
@@ -322,13 +552,18 @@ def main() -> int:
     parser.add_argument('--job-name', help='Job name')
     parser.add_argument('--branch', help='Branch name')
     parser.add_argument('--output-dir', type=Path, default='./artifacts')
+    parser.add_argument('--workers', type=int, default=8, help='Number of parallel downloads')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Do not use the pipeline metadata cache')
     parser.add_argument('-v', '--verbose', action='store_true', help='Enable verbose output')
 
     args = parser.parse_args()
     logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
 
+    downloader = None
     try:
-        downloader = ArtifactDownloader(args.url, args.token, args.output_dir)
+        downloader = ArtifactDownloader(args.url, args.token, args.output_dir, args.workers,
+                                        use_cache=not args.no_cache)
 
         if args.config:
             results = downloader.download_artifacts(config_path=args.config)
@@ -363,6 +598,9 @@ def main() -> int:
         if args.verbose:
             logger.debug('', exc_info=True)
         return 1
+    finally:
+        if downloader:
+            downloader.close()
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
-import os, sys, zipfile, json, shutil, argparse, logging, hashlib, re
+import os, sys, zipfile, json, shutil, argparse, logging, hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional
-from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from collections import Counter, defaultdict
 
 # Configure logging to write to stdout
 logger = logging.getLogger(__name__)
@@ -14,6 +15,34 @@ handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+_EXTENSION_SUFFIXES = frozenset(('.vsix', '.carts'))
+
+def sha256_file(path: Path) -> str:
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        sha256 = hashlib.sha256()
+        buf = bytearray(1 << 20)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha256.update(view[:n])
+        return sha256.hexdigest()
+
+def iter_files(root: str) -> Iterator[os.DirEntry]:
+    """Yield files under root, each directory's files before its subdirectories."""
+    subdirs = []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                yield entry
+    for subdir in subdirs:
+        yield from iter_files(subdir)
+
 @dataclass
 class ExtensionInfo:
     sha256: str
@@ -21,6 +50,10 @@ class ExtensionInfo:
     version: str
     file_format: str
     filename: str
+    package_name: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.package_name = self.install_path.split('.', 1)[-1]
 
     @staticmethod
     def parse_line(line: str) -> Optional['ExtensionInfo']:
@@ -39,7 +72,7 @@ class ExtensionInfo:
         return None
 
     def get_package_name(self) -> str:
-        return self.install_path.split('.', 1)[-1]
+        return self.package_name
 
 @dataclass
 class ProcessingStats:
@@ -48,18 +81,26 @@ class ProcessingStats:
     updated_extensions: List[tuple] = field(default_factory=list)
     new_extensions: List[ExtensionInfo] = field(default_factory=list)
     unchanged_extensions: List[ExtensionInfo] = field(default_factory=list)
+    updated_keys: Set[str] = field(default_factory=set)
+    unchanged_keys: Set[str] = field(default_factory=set)
 
 class ExtensionProcessor:
     def __init__(self, source_dir: str, target_dir: str):
         self.source_dir = Path(source_dir).resolve()
         self.target_dir = Path(target_dir).resolve()
         self.extension_list = self.target_dir / 'extension_list.txt'
+        self.stat_cache_path = self.target_dir / '.extension_list.stat'
         self.existing_extensions: Dict[str, ExtensionInfo] = {}
+        self._by_pkg: Dict[str, List[str]] = {}
+        self._format_counts: Counter = Counter()
+        self._stat_cache: Dict[str, dict] = {}
+        self._new_stat_cache: Dict[str, dict] = {}
         self.stats = ProcessingStats()
 
         self.target_dir.mkdir(parents=True, exist_ok=True)
         if self.extension_list.exists():
             self._load_extensions()
+            self._load_stat_cache()
 
         logger.info(f"Starting extensions processing")
         logger.info(f"Source directory: {self.source_dir}")
@@ -71,36 +112,108 @@ class ExtensionProcessor:
                 for line in f:
                     ext = ExtensionInfo.parse_line(line.strip())
                     if ext:
-                        self.existing_extensions[ext.filename] = ext
+                        self._add_extension(ext)
             logger.info(f"Loaded {len(self.existing_extensions)} entries from extension list")
         except Exception as e:
             logger.error(f"Failed to read extension list: {e}")
 
+    def _load_stat_cache(self):
+        try:
+            with open(self.stat_cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable stat cache: {e}")
+            return
+        if not isinstance(data, dict):
+            logger.warning(f"Ignoring malformed stat cache: {self.stat_cache_path}")
+            return
+        # Malformed entries are dropped, so those files are simply rehashed
+        self._stat_cache = {key: entry for key, entry in data.items() if self._valid_stat_entry(entry)}
+
+    @staticmethod
+    def _valid_stat_entry(entry) -> bool:
+        if not isinstance(entry, dict):
+            return False
+        stamp, digest, package = entry.get('stat'), entry.get('sha256'), entry.get('package')
+        return (isinstance(stamp, list) and len(stamp) == 2 and all(type(v) is int for v in stamp)
+                and isinstance(digest, str)
+                and isinstance(package, dict) and all(k in package for k in ('name', 'publisher', 'version')))
+
+    def _save_stat_cache(self):
+        try:
+            with open(self.stat_cache_path, 'w', encoding='utf-8') as f:
+                json.dump(self._new_stat_cache, f, separators=(',', ':'))
+        except Exception as e:
+            logger.warning(f"Failed to write stat cache: {e}")
+
     def _process_file(self, file_path: Path) -> Optional[dict]:
         try:
             if zipfile.is_zipfile(file_path):
                 with zipfile.ZipFile(file_path) as zf:
-                    for name in zf.namelist():
-                        if name.endswith('package.json'):
-                            try:
-                                info = json.loads(zf.read(name).decode())
-                                if all(f in info for f in ['name', 'publisher', 'version']):
-                                    return info
-                            except:
-                                continue
+                    candidates = [n for n in zf.namelist()
+                                  if n.endswith('package.json') and '__MACOSX' not in n
+                                  and not os.path.basename(n).startswith('._')]
+                    # VSIX manifest lives here; nested node_modules copies are only a fallback
+                    if 'extension/package.json' in candidates:
+                        candidates.remove('extension/package.json')
+                        candidates.insert(0, 'extension/package.json')
+                    for name in candidates:
+                        try:
+                            info = json.loads(zf.read(name))
+                            if all(f in info for f in ['name', 'publisher', 'version']):
+                                return info
+                        except:
+                            continue
         except Exception as e:
             logger.error(f"Failed to process {file_path}: {e}")
         return None
 
+    def _inspect_file(self, file_path: Path) -> Tuple[Optional[dict], Optional[str]]:
+        # Unchanged source files (same size and mtime) reuse the previous result
+        key = str(file_path)
+        st = file_path.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+        cached = self._stat_cache.get(key)
+        if cached and cached['stat'] == stamp:
+            self._new_stat_cache[key] = cached
+            return cached['package'], cached['sha256']
+
+        pkg_info = self._process_file(file_path)
+        if not pkg_info:
+            return None, None
+        digest = sha256_file(file_path)
+        if self.source_dir in file_path.parents:
+            self._new_stat_cache[key] = {
+                'stat': stamp,
+                'sha256': digest,
+                'package': {k: pkg_info[k] for k in ('name', 'publisher', 'version')}
+            }
+        return pkg_info, digest
+
+    def _add_extension(self, ext: ExtensionInfo):
+        replaced = self.existing_extensions.get(ext.filename)
+        if replaced is not None:
+            self._format_counts[replaced.file_format] -= 1
+        self.existing_extensions[ext.filename] = ext
+        self._format_counts[ext.file_format] += 1
+        self._by_pkg.setdefault(ext.package_name, []).append(ext.filename)
+
     def _handle_transition(self, package_name: str, new_info: Optional[ExtensionInfo] = None):
-        for filename, ext_info in list(self.existing_extensions.items()):
-            if ext_info.get_package_name() == package_name:
+        for filename in self._by_pkg.pop(package_name, ()):
+            ext_info = self.existing_extensions.get(filename)
+            # Index entries go stale when a filename is reused by another package
+            if ext_info is not None and ext_info.package_name == package_name:
                 if new_info:
                     if ext_info.version != new_info.version:
                         self.stats.updated_extensions.append((ext_info, new_info))
+                        self.stats.updated_keys.add(new_info.filename)
                     else:
                         self.stats.unchanged_extensions.append(new_info)
+                        self.stats.unchanged_keys.add(new_info.filename)
                 del self.existing_extensions[filename]
+                self._format_counts[ext_info.file_format] -= 1
                 if (self.target_dir / filename).exists():
                     (self.target_dir / filename).unlink()
 
@@ -109,11 +222,11 @@ class ExtensionProcessor:
         try:
             temp_dir.mkdir(exist_ok=True)
             with zipfile.ZipFile(zip_path) as zf:
-                for f in zf.filelist:
+                for f in zf.infolist():
                     if f.filename.lower().endswith(('.vsix', '.carts')) and '__MACOSX' not in f.filename:
-                        out_path = temp_dir / Path(f.filename).name
+                        out_path = temp_dir / os.path.basename(f.filename)
                         with zf.open(f) as src, open(out_path, 'wb') as dst:
-                            shutil.copyfileobj(src, dst)
+                            shutil.copyfileobj(src, dst, 1 << 20)
                         extracted.append(out_path)
                         self.stats.extracted_files[zip_path.name] += 1
             if extracted:
@@ -130,16 +243,14 @@ class ExtensionProcessor:
                 return
 
             extension_files = []
-            for file_path in self.source_dir.rglob('*'):
-                if not file_path.is_file():
-                    continue
-                ext = file_path.suffix.lower()
-                if ext in ['.vsix', '.carts']:
-                    extension_files.append(file_path)
+            for entry in iter_files(str(self.source_dir)):
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in _EXTENSION_SUFFIXES:
+                    extension_files.append(Path(entry.path))
                     self.stats.found_files[ext[1:]] += 1
                 elif ext == '.zip':
                     self.stats.found_files['zip'] += 1
-                    extension_files.extend(self._extract_extensions(file_path, temp_dir))
+                    extension_files.extend(self._extract_extensions(Path(entry.path), temp_dir))
 
             if not extension_files:
                 logger.info("No extensions found to process")
@@ -149,23 +260,35 @@ class ExtensionProcessor:
             for ext, count in self.stats.found_files.items():
                 logger.info(f"- {ext.upper()}: {count} files")
 
+            # Reading and hashing run in parallel; results are applied in file order
+            executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+            futures = []
+            by_inode = {}
+            for f in extension_files:
+                # The same file can be listed twice (hard links, same-named members of
+                # different zips extracted to one temp path); inspect it only once
+                try:
+                    st = os.stat(f)
+                    key = (st.st_dev, st.st_ino)
+                except OSError:
+                    key = f
+                if key not in by_inode:
+                    by_inode[key] = executor.submit(self._inspect_file, f)
+                futures.append(by_inode[key])
+            executor.shutdown(wait=False)
+
             processed = set()
-            for ext_file in extension_files:
+            for ext_file, future in zip(extension_files, futures):
                 try:
-                    pkg_info = self._process_file(ext_file)
+                    pkg_info, digest = future.result()
                     if pkg_info:
                         name = pkg_info['name']
                         if name in processed:
                             continue
                         processed.add(name)
 
-                        sha256 = hashlib.sha256()
-                        with open(ext_file, "rb") as f:
-                            for chunk in iter(lambda: f.read(4096), b""):
-                                sha256.update(chunk)
-
                         new_ext = ExtensionInfo(
-                            sha256=sha256.hexdigest(),
+                            sha256=digest,
                             install_path=f"{pkg_info['publisher']}.{name}",
                             version=pkg_info['version'],
                             file_format='carts' if ext_file.suffix.lower() == '.carts' else 'vsix',
@@ -175,18 +298,23 @@ class ExtensionProcessor:
                         self._handle_transition(name, new_ext)
 
                         shutil.copy2(ext_file, self.target_dir)
-                        self.existing_extensions[new_ext.filename] = new_ext
+                        self._add_extension(new_ext)
 
-                        if not any(t[1] == new_ext for t in self.stats.updated_extensions):
-                            if not any(e == new_ext for e in self.stats.unchanged_extensions):
-                                self.stats.new_extensions.append(new_ext)
+                        if (new_ext.filename not in self.stats.updated_keys
+                                and new_ext.filename not in self.stats.unchanged_keys):
+                            self.stats.new_extensions.append(new_ext)
 
                 except Exception as e:
                     logger.error(f"Failed to process {ext_file}: {e}")
 
-            with open(self.extension_list, 'w', encoding='utf-8') as f:
-                for ext in sorted(self.existing_extensions.values(), key=lambda x: x.install_path):
-                    f.write(f"{ext.sha256}:{ext.install_path}:{ext.version}:{ext.file_format}:{ext.filename}\n")
+            body = ''.join(
+                f"{ext.sha256}:{ext.install_path}:{ext.version}:{ext.file_format}:{ext.filename}\n"
+                for ext in sorted(self.existing_extensions.values(), key=lambda x: x.install_path)
+            )
+            tmp_list = self.extension_list.with_suffix('.tmp')
+            tmp_list.write_text(body, encoding='utf-8')
+            os.replace(tmp_list, self.extension_list)
+            self._save_stat_cache()
 
             logger.info("Final state summary:")
             logger.info(f"Total extensions in target: {len(self.existing_extensions)}")
@@ -206,13 +334,10 @@ class ExtensionProcessor:
             logger.info(f"- Added: {len(self.stats.new_extensions)}")
             logger.info(f"- Unchanged: {len(self.stats.unchanged_extensions)}")
 
-            formats = defaultdict(int)
-            for ext in self.existing_extensions.values():
-                formats[ext.file_format] += 1
-
             logger.info("Extension formats:")
-            for fmt, count in formats.items():
-                logger.info(f"- {fmt.upper()}: {count} extensions")
+            for fmt, count in self._format_counts.items():
+                if count:
+                    logger.info(f"- {fmt.upper()}: {count} extensions")
 
             logger.info("Extension list updated successfully")
 
@@ -1,17 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
 import hashlib
 import json
 import logging
+import mmap
 import os
-import re
+import string
 import subprocess
 import time
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
@@ -22,7 +25,62 @@ handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
-@dataclass
+try:
+   import blake3
+except ImportError:
+   blake3 = None
+
+MMAP_THRESHOLD = 2 * 1024 * 1024
+HASH_IMPL = os.environ.get('ARTIFACT_HASH', 'sha256').lower()
+
+def _new_hash(algo: str, data=b''):
+   if algo == 'blake3':
+       return blake3.blake3(data)
+   return hashlib.new(algo, data)
+
+def _hash_file(path: str, algo: str = 'sha256') -> str:
+   with open(path, "rb") as f:
+       if hasattr(os, 'posix_fadvise'):
+           # Ask the kernel for aggressive readahead; the whole file is read once
+           os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+           os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+       # 32-bit builds cannot map files beyond their address space; stream those
+       if MMAP_THRESHOLD < os.fstat(f.fileno()).st_size <= sys.maxsize:
+           # Hash straight from the page cache without copying into a read buffer
+           with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+               if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                   mm.madvise(mmap.MADV_SEQUENTIAL)
+               return _new_hash(algo, mm).hexdigest()
+       if hasattr(hashlib, 'file_digest'):
+           return hashlib.file_digest(f, lambda: _new_hash(algo)).hexdigest()
+       digest = _new_hash(algo)
+       buf = bytearray(1 << 20)
+       view = memoryview(buf)
+       while True:
+           n = f.readinto(buf)
+           if not n:
+               break
+           digest.update(view[:n])
+       return digest.hexdigest()
+
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@functools.lru_cache(maxsize=None)
+def _git_rev_parse(cwd: str) -> str:
+   # Only reached when .git cannot be read directly; one fork per checkout
+   result = subprocess.run(
+       ['git', 'rev-parse', 'HEAD'],
+       cwd=cwd,
+       capture_output=True,
+       text=True,
+       check=True
+   )
+   commit = result.stdout.strip()
+   if not commit:
+       raise ValueError("Empty commit ID returned")
+   return commit
+
+@dataclass(**_DATACLASS_SLOTS)
 class FileInfo:
    path: Path
    version: str
@@ -31,8 +89,9 @@ class FileInfo:
    os_type: str
    subproduct_name: str
    timestamp: int
-   sha256: str
+   digest: str
    new_name: str
+   hash_algo: str = 'sha256'
 
 class ArtifactProcessor:
    ARCH_MAP = {
@@ -46,6 +105,7 @@ class ArtifactProcessor:
        'exe': 'windows',
        'dmg': 'darwin'
    }
+   OS_SUFFIX_MAP = {f'.{ext}': os_type for ext, os_type in OS_FILE_MAP.items()}
 
    def __init__(self, package_json_path: str):
        self.package_path = Path(package_json_path)
@@ -55,49 +115,76 @@ class ArtifactProcessor:
        self.version = self._get_package_version()
        self.commit_id = self._get_git_commit_id()
        self.subproduct_name = os.environ.get('subProductName', 'default')
+       self.hash_algo = HASH_IMPL
+       if self.hash_algo == 'blake3' and blake3 is None:
+           raise ValueError("ARTIFACT_HASH=blake3 requires the blake3 package")
+       try:
+           _new_hash(self.hash_algo).hexdigest()
+       except (ValueError, TypeError):
+           raise ValueError(f"Unsupported ARTIFACT_HASH: {self.hash_algo}") from None
        
        logger.info(f"Initialized with version {self.version}, commit {self.commit_id}")
 
    def _get_package_version(self) -> str:
        try:
-           with open(self.package_path) as f:
-               version = json.load(f).get('version')
-               if not version:
-                   raise ValueError("No version found in package.json")
-               return version
+           version = json.loads(self.package_path.read_bytes()).get('version')
+           if not version:
+               raise ValueError("No version found in package.json")
+           return version
        except Exception as e:
            logger.error(f"Failed to read version: {e}")
            raise
 
+   def _read_git_head(self) -> Optional[str]:
+       # Resolve HEAD from the .git directory; None means ask git itself
+       start = self.package_path.parent.resolve()
+       for parent in (start, *start.parents):
+           git_dir = parent / '.git'
+           if git_dir.exists():
+               break
+       else:
+           return None
+       if not git_dir.is_dir():
+           return None  # worktree or submodule: .git is a pointer file
+
+       head = (git_dir / 'HEAD').read_text().strip()
+       if not head.startswith('ref: '):
+           return head
+       ref = head[5:]
+       ref_path = git_dir / ref
+       if ref_path.is_file():
+           return ref_path.read_text().strip()
+       packed = git_dir / 'packed-refs'
+       if packed.is_file():
+           for line in packed.read_text().splitlines():
+               sha, _, name = line.partition(' ')
+               if name == ref:
+                   return sha
+       return None
+
    def _get_git_commit_id(self) -> str:
        try:
-           result = subprocess.run(
-               ['git', 'rev-parse', 'HEAD'],
-               cwd=self.package_path.parent,
-               capture_output=True,
-               text=True,
-               check=True
-           )
-           commit = result.stdout.strip()
-           if not commit:
-               raise ValueError("Empty commit ID returned")
-           return commit
+           commit = self._read_git_head()
+           if commit and all(c in string.hexdigits for c in commit):
+               return commit
+       except OSError as e:
+           logger.debug("Reading .git directly failed, falling back to git: %s", e)
+
+       try:
+           return _git_rev_parse(str(self.package_path.parent.resolve()))
        except Exception as e:
            logger.error(f"Failed to get commit ID: {e}")
            raise
 
-   def _calculate_sha256(self, file_path: Path) -> str:
-       if not file_path.exists():
-           raise FileNotFoundError(f"File not found: {file_path}")
-           
+   def _calculate_digest(self, file_path: Path, pending: Optional[Dict[Path, Future]] = None) -> str:
+       # No separate exists() stat: opening the file reports a missing one
        try:
-           sha256_hash = hashlib.sha256()
-           with open(file_path, "rb") as f:
-               for chunk in iter(lambda: f.read(4096), b""):
-                   sha256_hash.update(chunk)
-           return sha256_hash.hexdigest()
+           future = pending.pop(file_path, None) if pending else None
+           if future is not None:
+               return future.result()
+           return _hash_file(str(file_path), self.hash_algo)
        except Exception as e:
-           logger.error(f"Failed to calculate SHA256: {e}")
+           logger.error(f"Failed to calculate {self.hash_algo}: {e}")
            raise
 
    def _parse_filename(self, file_path: Path) -> Dict[str, str]:
@@ -110,14 +197,13 @@ class ArtifactProcessor:
        product = parts[1]  # e.g. 'inscode' or 'python'
        
        # Find version and arch
-       version_pattern = r'(\d+\.\d+\.\d+)'
        arch = None
        version = None
        
        for part in parts:
-           if part in ['x64', 'arm64']:
+           if part in self.ARCH_MAP:
                arch = part
-           elif re.match(version_pattern, part):
+           elif self._starts_with_version(part):
                version = part
                
        if not arch or not version:
@@ -137,15 +223,20 @@ class ArtifactProcessor:
            'os': os_type
        }
 
+   @staticmethod
+   def _starts_with_version(part: str) -> bool:
+       # Same as re.match(r'\d+\.\d+\.\d+', part) without the regex engine
+       fields = part.split('.', 3)
+       return (len(fields) >= 3 and fields[0].isdecimal() and fields[1].isdecimal()
+               and fields[2][:1].isdecimal())
+
    def _detect_os_type(self, file_path: Path) -> Optional[str]:
-       extension = file_path.suffix.lower()[1:]
-       return self.OS_FILE_MAP.get(extension)
+       return self.OS_SUFFIX_MAP.get(file_path.suffix.lower())
 
-   def process_file(self, file_path: Path) -> FileInfo:
-       if not file_path.exists():
-           raise FileNotFoundError(f"File not found: {file_path}")
-           
-       logger.info(f"Processing file: {file_path}")
+   def process_file(self, file_path: Path, timestamp: Optional[int] = None,
+                    pending: Optional[Dict[Path, Future]] = None) -> FileInfo:
+       # A missing file surfaces as FileNotFoundError from the hash step
+       logger.debug("Processing file: %s", file_path)
        parsed = self._parse_filename(file_path)
        
        if parsed['version'] != self.version:
@@ -158,60 +249,117 @@ class ArtifactProcessor:
            arch=self.ARCH_MAP[parsed['arch']],
            os_type=parsed['os'],
            subproduct_name=self.subproduct_name,
-           timestamp=int(time.time()),
-           sha256=self._calculate_sha256(file_path),
-           new_name=file_path.stem
+           timestamp=timestamp if timestamp is not None else int(time.time()),
+           digest=self._calculate_digest(file_path, pending),
+           new_name=file_path.stem,
+           hash_algo=self.hash_algo
        )
 
    def generate_metadata(self, file_info: FileInfo) -> Dict[str, Any]:
-       return {
+       metadata = {
            'current_version': file_info.version,
            'commit_id': file_info.commit_id,
            'arch': file_info.arch,
            'os_type': file_info.os_type,
            'sub_product_name': file_info.subproduct_name,
            'timestamp': file_info.timestamp,
-           'sha256hash': file_info.sha256,
+           'sha256hash': file_info.digest,
            'is_server': False
        }
+       if file_info.hash_algo != 'sha256':
+           del metadata['sha256hash']
+           metadata['hash_algo'] = file_info.hash_algo
+           metadata['hash'] = file_info.digest
+       return metadata
 
    def process_directory(self, directory: Path, extensions: List[str]) -> List[FileInfo]:
+       return list(self.iter_process_directory(directory, extensions))
+
+   def iter_process_directory(self, directory: Path, extensions: List[str]) -> Iterator[FileInfo]:
+       # Yields each artifact as soon as it is renamed and its metadata written
        if not directory.exists():
            raise FileNotFoundError(f"Directory not found: {directory}")
            
        logger.info(f"Processing directory: {directory} for extensions: {extensions}")
-       results = []
+       processed = 0
+
+       # One directory listing for all extensions, bucketed in the requested order
+       wanted = list(dict.fromkeys(extensions))
+       buckets = {ext: [] for ext in wanted if ext in self.OS_FILE_MAP}
+       with os.scandir(directory) as it:
+           for entry in it:
+               _, dot, ext = entry.name.rpartition('.')
+               if dot and ext in buckets and entry.is_file():
+                   buckets[ext].append(Path(entry.path))
+       groups = [(ext, buckets.get(ext)) for ext in wanted]
+       # Futures live with this generator so concurrent runs never share them
+       pending: Dict[Path, Future] = {}
+       executor = self._start_hashing([p for _, files in groups if files for p in files], pending)
+
+       # One timestamp per batch: files processed together share it
+       now = int(time.time())
+       try:
+           for file_info in self._process_groups(groups, now, pending):
+               processed += 1
+               yield file_info
+       finally:
+           for future in pending.values():
+               future.cancel()
+           if executor:
+               executor.shutdown()
 
-       for ext in extensions:
-           if ext not in self.OS_FILE_MAP:
+       if not processed:
+           logger.warning(f"No valid files found in {directory}")
+       else:
+           logger.info(f"Successfully processed {processed} files")
+
+   def _start_hashing(self, files: List[Path], pending: Dict[Path, Future]) -> Optional[ThreadPoolExecutor]:
+       # Only files that will pass validation are hashed, as in the sequential path
+       valid = []
+       for file_path in files:
+           try:
+               if self._parse_filename(file_path)['version'] == self.version:
+                   valid.append(file_path)
+           except ValueError:
+               continue
+       if len(valid) < 2:
+           return None
+
+       # hashlib releases the GIL while digesting, so threads hash files in parallel
+       executor = ThreadPoolExecutor(max_workers=min(len(valid), os.cpu_count() or 1))
+       for file_path in valid:
+           pending[file_path] = executor.submit(_hash_file, str(file_path), self.hash_algo)
+       return executor
+
+   def _process_groups(self, groups, now: int, pending: Dict[Path, Future]) -> Iterator[FileInfo]:
+       timestamp = datetime.fromtimestamp(now).strftime('%Y%m%d%H%M')
+       for ext, files in groups:
+           if files is None:
                logger.warning(f"Unsupported extension: {ext}")
                continue
                
-           for file_path in directory.glob(f"*.{ext}"):
+           for file_path in files:
                try:
-                   file_info = self.process_file(file_path)
+                   file_info = self.process_file(file_path, now, pending)
                    metadata = self.generate_metadata(file_info)
-                   timestamp = datetime.fromtimestamp(file_info.timestamp).strftime('%Y%m%d%H%M')
                    
-                   new_file_path = file_path.with_name(f"{file_path.stem}-{timestamp}{file_path.suffix}")
-                   metadata_path = new_file_path.with_suffix(f"{file_path.suffix}.json")
+                   payload = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+
+                   # Plain string paths: no intermediate Path objects per artifact
+                   old_path = os.fspath(file_path)
+                   new_name = f"{file_path.stem}-{timestamp}{file_path.suffix}"
+                   new_path = os.path.join(os.path.dirname(old_path), new_name)
                    
-                   file_path.rename(new_file_path)
-                   with open(metadata_path, 'w') as f:
-                       json.dump(metadata, f, indent=2)
+                   os.rename(old_path, new_path)
+                   # Buffered write: write() keeps going until the whole payload is out
+                   with open(new_path + '.json', 'wb') as f:
+                       f.write(payload)
 
-                   logger.info(f"Processed {new_file_path}")
-                   results.append(file_info)
+                   logger.info("Processed %s -> %s", file_path.name, new_name)
                except Exception as e:
                    logger.warning(f"Failed to process {file_path}: {e}")
                    continue
-
-       if not results:
-           logger.warning(f"No valid files found in {directory}")
-       else:
-           logger.info(f"Successfully processed {len(results)} files")
-           
-       return results
+               yield file_info
 
 def main():
    parser = argparse.ArgumentParser(description='Process artifacts')
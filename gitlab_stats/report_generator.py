@@ -1,4 +1,6 @@
 import gitlab, argparse, logging, sys, csv, jinja2
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Tuple, Set
 from datetime import datetime
 
@@ -6,22 +8,37 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 class GitLabScanner:
-  def __init__(self, token: str, url: str):
+  def __init__(self, token: str, url: str, max_workers: int = 16):
       logger.info(f"Connecting to GitLab instance: {url}")
-      self.gl = gitlab.Gitlab(url, private_token=token, per_page=100)
+      self.gl = gitlab.Gitlab(url, private_token=token, per_page=100, retry_transient_errors=True)
+      max_workers = max(1, max_workers)
+      # Keep-alive connections shared by every API call of the scan, one per worker
+      adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(max_workers, 10))
+      self.gl.session.mount('https://', adapter)
+      self.gl.session.mount('http://', adapter)
       self.unique_projects: Set[str] = set()
+      self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gitlab-scan')
+
+  def close(self) -> None:
+      self._executor.shutdown(wait=True)
+
+  def get_project(self, project):
+      # One request per project; the helpers below read from the returned object
+      try:
+          return self.gl.projects.get(project.id, statistics=True)
+      except Exception as e:
+          logger.error(f"Error getting project {project.id}: {str(e)}")
+          return project
   
-  def get_default_branch(self, project_id: int) -> str:
+  def get_default_branch(self, project) -> str:
       try:
-          project = self.gl.projects.get(project_id)
           return project.default_branch or 'master'
       except Exception as e:
-          logger.error(f"Error getting default branch for project {project_id}: {str(e)}")
+          logger.error(f"Error getting default branch for project {project.id}: {str(e)}")
           return 'master'
   
-  def get_project_size(self, project_id: int) -> Dict[str, int]:
+  def get_project_size(self, project) -> Dict[str, int]:
       try:
-          project = self.gl.projects.get(project_id, statistics=True)
           stats = project.statistics
           return {
               'repository_size': stats.get('repository_size', 0),
@@ -29,34 +46,56 @@ class GitLabScanner:
               'artifacts_size': stats.get('job_artifacts_size', 0)
           }
       except Exception as e:
-          logger.error(f"Error getting size for project {project_id}: {str(e)}")
+          logger.error(f"Error getting size for project {project.id}: {str(e)}")
           return {'repository_size': 0, 'storage_size': 0, 'artifacts_size': 0}
 
-  def has_ci_file(self, project_id: int, default_branch: str) -> bool:
+  def has_ci_file(self, project, default_branch: str) -> bool:
       try:
-          project = self.gl.projects.get(project_id)
-          project.files.get('.gitlab-ci.yml', ref=default_branch)
+          try:
+              # HEAD answers from the file's headers; the content is never downloaded
+              project.files.head('.gitlab-ci.yml', ref=default_branch)
+          except AttributeError:
+              # python-gitlab releases without files.head(): fetch the file instead
+              project.files.get('.gitlab-ci.yml', ref=default_branch)
           return True
-      except:
+      except gitlab.exceptions.GitlabError as e:
+          if e.response_code != 404:
+              logger.error(f"Error checking CI file for project {project.id}: {str(e)}")
+          return False
+      except Exception as e:
+          logger.error(f"Error checking CI file for project {project.id}: {str(e)}")
           return False
 
-  def get_last_commit_date(self, project_id: int, default_branch: str) -> str:
+  def get_last_commit_date(self, project, default_branch: str) -> str:
       try:
-          project = self.gl.projects.get(project_id)
-          commits = project.commits.list(page=1, per_page=1)
-          return commits[0].committed_date.split('.')[0].replace('T', ' ') if commits else 'N/A'
+          # Only the newest entry is needed: take it off the first page, build no list
+          commit = next(project.commits.list(per_page=1, iterator=True), None)
+          return commit.committed_date.split('.')[0].replace('T', ' ') if commit else 'N/A'
       except Exception as e:
-          logger.error(f"Error getting last commit for project {project_id}: {str(e)}")
+          logger.error(f"Error getting last commit for project {project.id}: {str(e)}")
           return 'N/A'
 
-  def get_last_pipeline_date(self, project_id: int) -> str:
+  def get_last_pipeline_date(self, project) -> str:
       try:
-          project = self.gl.projects.get(project_id)
-          pipelines = project.pipelines.list(page=1, per_page=1)
-          return pipelines[0].created_at.split('.')[0].replace('T', ' ') if pipelines else 'N/A'
-      except:
+          pipeline = next(project.pipelines.list(per_page=1, iterator=True, order_by='id', sort='desc'), None)
+          return pipeline.created_at.split('.')[0].replace('T', ' ') if pipeline else 'N/A'
+      except Exception as e:
+          logger.error(f"Error getting last pipeline for project {project.id}: {str(e)}")
           return 'N/A'
           
+  def _project_info(self, project) -> Dict:
+      full = self.get_project(project)
+      default_branch = self.get_default_branch(full)
+      return {
+          'url': project.web_url,
+          'name': project.name,
+          'branch': default_branch,
+          'sizes': self.get_project_size(full),
+          'has_ci': self.has_ci_file(full, default_branch),
+          'last_commit': self.get_last_commit_date(full, default_branch),
+          'last_pipeline': self.get_last_pipeline_date(full)
+      }
+
   def scan_group(self, group_id: int) -> Tuple[Dict[str, List[Dict]], Dict[str, int]]:
       results = {}
       summary = {
@@ -76,36 +115,27 @@ class GitLabScanner:
               if not projects:
                   break
                   
+              new_projects = []
               for project in projects:
                   if project.web_url in self.unique_projects:
                       continue
                   self.unique_projects.add(project.web_url)
-                  
                   logger.info(f"Processing project: {project.name}")
+                  new_projects.append(project)
+
+              # Projects are independent API round-trips; map keeps the listing order
+              for project, project_info in zip(new_projects, self._executor.map(self._project_info, new_projects)):
                   namespace = project.namespace['full_path']
                   if namespace not in results:
                       results[namespace] = []
-                      
-                  default_branch = self.get_default_branch(project.id)
-                  sizes = self.get_project_size(project.id)
-                  has_ci = self.has_ci_file(project.id, default_branch)
-                  
-                  project_info = {
-                      'url': project.web_url,
-                      'name': project.name,
-                      'branch': default_branch,
-                      'sizes': sizes,
-                      'has_ci': has_ci,
-                      'last_commit': self.get_last_commit_date(project.id, default_branch),
-                      'last_pipeline': self.get_last_pipeline_date(project.id)
-                  }
                   results[namespace].append(project_info)
                   
+                  sizes = project_info['sizes']
                   summary['total_projects'] += 1
                   summary['total_repo_size'] += sizes['repository_size']
                   summary['total_storage_size'] += sizes['storage_size']
                   summary['total_artifacts_size'] += sizes['artifacts_size']
-                  if has_ci:
+                  if project_info['has_ci']:
                       summary['projects_with_ci'] += 1
                       
               page += 1
@@ -183,13 +213,17 @@ tr:hover .p a{opacity:1}
 columnDefs:[{targets:[3,4,5],type:'num',render:function(d,t){if(t==='sort')return parseFloat(d.replace(/[^0-9.]/g,''))*(d.includes('GB')?1024:1);return d;}},
 {targets:[7,8],type:'date'}]});$('.dtf input').attr('placeholder','Global Search...').addClass('form-control');});</script></body></html>"""
 
+# Parsed once per process; project names and branches are escaped into the HTML
+_ENV = jinja2.Environment(autoescape=True, auto_reload=False, trim_blocks=True, lstrip_blocks=True)
+_ENV.filters['format_size'] = format_size
+_TEMPLATE = _ENV.from_string(template)
+
 def generate_report(projects: Dict[str, List[Dict]], summary: Dict[str, int], output_base: str):
   try:
-      env = jinja2.Environment()
-      env.filters['format_size'] = format_size
-      html = env.from_string(template).render(results=projects, summary=summary, format_size=format_size)
-      with open(f"{output_base}.html", 'w', encoding='utf-8-sig' if sys.platform == 'win32' else 'utf-8') as f:
-          f.write(html)
+      # Streamed into the file buffer rather than rendered into one string first
+      with open(f"{output_base}.html", 'w', encoding='utf-8-sig' if sys.platform == 'win32' else 'utf-8',
+                buffering=1 << 20) as f:
+          _TEMPLATE.stream(results=projects, summary=summary, format_size=format_size).dump(f)
           
       with open(f"{output_base}.csv", 'w', newline='', encoding='utf-8-sig' if sys.platform == 'win32' else 'utf-8') as f:
           writer = csv.writer(f)
@@ -219,10 +253,14 @@ def main():
   parser.add_argument('--token', required=True, help='GitLab API token')
   parser.add_argument('--group-id', type=int, required=True, help='GitLab group ID')
   parser.add_argument('--gitlab-url', default='https://gitlab.com', help='GitLab URL')
+  parser.add_argument('--workers', type=int, default=16, help='Projects scanned concurrently')
   args = parser.parse_args()
 
-  scanner = GitLabScanner(args.token, args.gitlab_url)
-  results, summary = scanner.scan_group(args.group_id)
+  scanner = GitLabScanner(args.token, args.gitlab_url, args.workers)
+  try:
+      results, summary = scanner.scan_group(args.group_id)
+  finally:
+      scanner.close()
   generate_report(results, summary, "report")
 
 if __name__ == '__main__':